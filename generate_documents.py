@@ -12,30 +12,67 @@ import os
 import sys
 import subprocess
 import re
+import traceback
+from array import array
 from datetime import datetime
+from itertools import groupby, islice
+from operator import itemgetter
 from pathlib import Path
-from typing import List, Tuple, Optional
+from typing import Callable, Iterable, Iterator, List, Sequence, Tuple, Optional
+from xml.sax.saxutils import escape
+from zipfile import BadZipFile
 
 try:
     from openpyxl import load_workbook
     from openpyxl.utils import get_column_letter
+    from openpyxl.utils.exceptions import InvalidFileException
 except ImportError:
     print("ОШИБКА: Библиотека openpyxl не установлена.")
     print("Установите её командой: pip install openpyxl")
     sys.exit(1)
 
+# Опциональные движки чтения: python-calamine парсит .xlsx в 10-50 раз
+# быстрее openpyxl, xlrd нужен для устаревшего формата .xls.
+# Оба не обязательны — без них работает потоковое чтение через openpyxl.
+try:
+    from python_calamine import CalamineWorkbook
+except ImportError:
+    CalamineWorkbook = None
+
+try:
+    import xlrd
+except ImportError:
+    xlrd = None
+
+# Ошибки чтения Excel, обрабатываемые штатно (с сообщением, без падения
+# скрипта): повреждённый или переименованный не-zip .xlsx openpyxl
+# поднимает как zipfile.BadZipFile; ошибки опциональных движков
+# добавляются, только если сам движок установлен
+_EXCEL_READ_ERRORS: tuple = (OSError, KeyError, InvalidFileException, BadZipFile)
+if CalamineWorkbook is not None:
+    from python_calamine import CalamineError
+    _EXCEL_READ_ERRORS += (CalamineError,)
+if xlrd is not None:
+    _EXCEL_READ_ERRORS += (xlrd.XLRDError,)
+
 try:
     from docx import Document
     from docx.shared import Inches, Pt, RGBColor
     from docx.enum.text import WD_ALIGN_PARAGRAPH
     from docx.enum.section import WD_ORIENT
-    from docx.enum.table import WD_CELL_VERTICAL_ALIGNMENT
+    from docx.oxml.ns import nsmap, qn
+    from lxml import etree
 except ImportError:
     print("ОШИБКА: Библиотека python-docx не установлена.")
     print("Установите её командой: pip install python-docx")
     sys.exit(1)
 
 
+# Строка данных Excel: кортеж строковых значений ячеек. Кортежи компактнее
+# списков и неизменяемы — строки после чтения больше не модифицируются
+Row = Tuple[str, ...]
+
+
 # ============================================================================
 # КОНФИГУРАЦИЯ ПУТЕЙ И ПАРАМЕТРОВ
 # ============================================================================
@@ -62,12 +99,84 @@ TABLE_HEADERS = [
 # Номера столбцов для второй строки заголовков (все столбцы пронумерованы)
 COLUMN_NUMBERS = ["1", "2", "3", "4", "5", "6"]
 
+# Варианты названий столбцов Excel для каждого заполняемого столбца Word-таблицы
+# (ключ — индекс столбца Word-таблицы; новый алиас добавляется сюда, без правки кода)
+COLUMN_SEARCH = {
+    # Столбец 1: Наименование дефекта/повреждения
+    1: [
+        "Наименование дефекта / повреждения",
+        "Наименование дефекта/повреждения",
+        "Наименование дефекта",
+        "Дефект",
+        "Повреждение"
+    ],
+    # Столбец 3: Номер фото из фотоматериалов
+    3: [
+        "Номер фото из фотоматериалов",
+        "Номер фото",
+        "Фото",
+        "Фотоматериалы",
+        "Номер фото из фото"
+    ],
+    # Столбец 4: Контролируемый параметр дефекта
+    4: [
+        "Контролируемый параметр дефекта",
+        "Параметр дефекта",
+        "Контролируемый параметр",
+        "Параметр",
+        "Параметры"
+    ],
+    # Столбец 5: Примечание
+    5: [
+        "Примечание",
+        "Примечания",
+        "Комментарий",
+        "Замечания"
+    ],
+}
+
+# Варианты названий столбца с наименованием конструкций (для группировки)
+CONSTRUCTION_ALIASES = [
+    "Наименование конструкций",
+    "Конструкции",
+    "Конструкция",
+    "Тип конструкции",
+    "Элемент конструкции"
+]
+
 # Параметры форматирования
 FONT_NAME = "Roboto"  # Используется Roboto, если доступен, иначе Liberation Sans
 FONT_SIZE = Pt(11)
 TABLE_BORDER_WIDTH = Pt(0.5)
 TABLE_BORDER_COLOR = RGBColor(0, 0, 0)  # Чёрный
 
+# Размеры шрифта таблицы в полупунктах (так их хранит Word);
+# заголовок конструкции чуть крупнее основного текста
+FONT_SIZE_HALF_PT = int(FONT_SIZE.pt * 2)
+CONSTRUCTION_FONT_SIZE_HALF_PT = int(Pt(12).pt * 2)
+
+# Ширины столбцов таблицы в дюймах: № п/п минимальный (0.25"), остальные
+# распределяются пропорционально доле в доступной ширине страницы.
+# Значения в dxa (1/20 пункта) вычисляются один раз при импорте модуля
+TABLE_COLUMN_WIDTHS = [0.25, 2.5, 1.5, 1.0, 2.5, 1.5]  # № п/п (мин), Наименование, Место, Фото, Параметр, Примечание
+_TOTAL_COLUMN_WIDTH = sum(TABLE_COLUMN_WIDTHS)
+TABLE_COLUMN_WIDTHS_DXA = [int(0.25 * 1440)] + [
+    int(w / (_TOTAL_COLUMN_WIDTH - TABLE_COLUMN_WIDTHS[0]) * (9.27 - 0.25) * 1440)
+    for w in TABLE_COLUMN_WIDTHS[1:]
+]
+TABLE_WIDTH_DXA = sum(TABLE_COLUMN_WIDTHS_DXA)
+
+# Границы таблицы одной готовой XML-строкой (0.5pt = 4 единицы по 1/8 pt)
+# вместо шести OxmlElement с четырьмя .set() на каждый
+_TBL_BORDERS_XML = (
+    '<w:tblBorders xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+    + ''.join(
+        f'<w:{side} w:val="single" w:sz="4" w:space="0" w:color="000000"/>'
+        for side in ('top', 'left', 'bottom', 'right', 'insideH', 'insideV')
+    )
+    + '</w:tblBorders>'
+)
+
 
 # ============================================================================
 # ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ
@@ -77,8 +186,10 @@ def create_directories():
     """Создаёт необходимые директории, если они не существуют."""
     directories = [DATA_DIR, OUTPUT_DIR, TEMPLATES_DIR, FONTS_DIR]
     for directory in directories:
-        directory.mkdir(exist_ok=True)
-        print(f"✓ Проверена директория: {directory}")
+        # Создаём (и сообщаем об этом) только реально отсутствующие директории
+        if not directory.exists():
+            directory.mkdir(parents=True)
+            print(f"✓ Создана директория: {directory}")
 
 
 def get_excel_files() -> List[Path]:
@@ -88,18 +199,18 @@ def get_excel_files() -> List[Path]:
     Returns:
         List[Path]: Список путей к .xlsx и .xls файлам
     """
-    excel_files = []
-    
     if not DATA_DIR.exists():
         print(f"ОШИБКА: Папка {DATA_DIR} не существует. Создаю...")
         create_directories()
-        return excel_files
-    
-    # Ищем файлы с расширениями .xlsx и .xls
-    extensions = ['.xlsx', '.xls']
-    for ext in extensions:
-        excel_files.extend(DATA_DIR.glob(f'*{ext}'))
-    
+        return []
+
+    # Один проход по директории вместо двух glob-сканов; suffix.lower()
+    # также подхватывает файлы с расширениями в верхнем регистре (.XLSX)
+    excel_files = [
+        path for path in DATA_DIR.iterdir()
+        if path.suffix.lower() in {'.xlsx', '.xls'} and path.is_file()
+    ]
+
     return sorted(excel_files)
 
 
@@ -156,296 +267,504 @@ def select_excel_file(excel_files: List[Path]) -> Optional[Path]:
             return None
 
 
-def find_column_index(headers: List[str], search_names: List[str]) -> Optional[int]:
+# Предкомпилированный шаблон для схлопывания повторяющихся пробелов
+_WS_RE = re.compile(r'\s+')
+
+
+def normalize_header(text) -> str:
+    """Нормализует текст заголовка: убирает лишние пробелы, приводит к нижнему регистру."""
+    return _WS_RE.sub(' ', str(text).strip()).lower()
+
+
+def build_header_map(normalized_headers: List[str]) -> dict:
+    """
+    Строит словарь {нормализованный заголовок: индекс столбца}.
+
+    При дублирующихся заголовках сохраняется первый индекс — так же,
+    как вёл бы себя поиск по списку.
+
+    Args:
+        normalized_headers: Заголовки столбцов, уже пропущенные через normalize_header
+
+    Returns:
+        dict: Маппинг заголовка на индекс столбца
+    """
+    header_map = {}
+    for idx, header in enumerate(normalized_headers):
+        header_map.setdefault(header, idx)
+    return header_map
+
+
+def build_compact_headers(header_map: dict) -> List[Tuple[str, int]]:
+    """
+    Готовит пары (заголовок без пробелов, индекс) для гибкого поиска.
+
+    Варианты заголовков без пробелов вычисляются один раз на файл, а не
+    на каждую пару (искомое название, заголовок).
+
+    Args:
+        header_map: Словарь {нормализованный заголовок: индекс} из build_header_map
+
+    Returns:
+        List[Tuple[str, int]]: Пары (заголовок без пробелов, индекс столбца)
+    """
+    return [(header.replace(' ', ''), idx) for header, idx in header_map.items()]
+
+
+def find_column_index(header_map: dict, compact_headers: List[Tuple[str, int]],
+                      search_names: List[str]) -> Optional[int]:
     """
     Находит индекс столбца по различным вариантам названий.
-    
+
     Args:
-        headers: Список заголовков столбцов из Excel
+        header_map: Словарь {нормализованный заголовок: индекс} из build_header_map
+        compact_headers: Пары (заголовок без пробелов, индекс) из build_compact_headers
         search_names: Список вариантов названий для поиска
-        
+
     Returns:
         Optional[int]: Индекс найденного столбца или None
     """
-    # Нормализуем строки для поиска (убираем лишние пробелы, приводим к нижнему регистру)
-    def normalize(text):
-        """Нормализует текст: убирает лишние пробелы, приводит к нижнему регистру"""
-        text = str(text).strip()
-        # Заменяем множественные пробелы на один
-        text = re.sub(r'\s+', ' ', text)
-        return text.lower()
-    
-    normalized_headers = [normalize(h) for h in headers]
-    
     for search_name in search_names:
-        normalized_search = normalize(search_name)
-        
-        # Точное совпадение
-        if normalized_search in normalized_headers:
-            return normalized_headers.index(normalized_search)
-        
-        # Поиск по подстроке (содержит) - более гибкий поиск
-        for idx, header in enumerate(normalized_headers):
-            # Удаляем все пробелы для более гибкого сравнения
-            if (normalized_search.replace(' ', '') in header.replace(' ', '') or 
-                header.replace(' ', '') in normalized_search.replace(' ', '')):
+        normalized_search = normalize_header(search_name)
+
+        # Точное совпадение — O(1) по словарю
+        found = header_map.get(normalized_search)
+        if found is not None:
+            return found
+
+        # Поиск по подстроке (содержит) - более гибкий поиск без учёта пробелов;
+        # искомое название сжимается один раз перед циклом
+        search_compact = normalized_search.replace(' ', '')
+        for header_compact, idx in compact_headers:
+            if search_compact in header_compact or header_compact in search_compact:
                 return idx
-    
+
     return None
 
 
-def read_excel_file(file_path: Path, sheet_name: Optional[str] = None) -> Tuple[List[List[str]], Optional[str], dict, Optional[int]]:
+def _iter_raw_rows_openpyxl(file_path: Path, sheet_name: str,
+                            max_col: Optional[int] = None) -> Iterator[tuple]:
+    """Потоково отдаёт все строки листа (включая заголовки) через openpyxl."""
+    workbook = load_workbook(file_path, data_only=True, read_only=True)
+    try:
+        # max_col обрезает парсинг строки прямо в openpyxl: ячейки правее
+        # вообще не разбираются из XML
+        yield from workbook[sheet_name].iter_rows(values_only=True, max_col=max_col)
+    finally:
+        workbook.close()
+
+
+# Кэш последнего разобранного листа для calamine (ключ — путь и имя листа,
+# значение — mtime файла и список строк). У calamine нет потокового API:
+# to_python() материализует лист целиком, поэтому повторный парсинг на
+# каждый из трёх проходов main разорял бы память и время втрое. Это
+# сознательный размен: путь через calamine держит один лист в памяти
+# вместо потоковой гарантии openpyxl, зато парсит его в 10-50 раз быстрее
+_calamine_sheet_cache: dict = {}
+
+
+def _iter_raw_rows_calamine(file_path: Path, sheet_name: str,
+                            max_col: Optional[int] = None) -> Iterator[tuple]:
+    """Отдаёт все строки листа через python-calamine (Rust-парсер)."""
+    cache_key = (str(file_path), sheet_name)
+    mtime = os.path.getmtime(file_path)
+    cached = _calamine_sheet_cache.get(cache_key)
+    if cached is None or cached[0] != mtime:
+        workbook = CalamineWorkbook.from_path(str(file_path))
+        rows = workbook.get_sheet_by_name(sheet_name).to_python()
+        # Держим только последний лист, чтобы кэш не рос с числом файлов
+        _calamine_sheet_cache.clear()
+        _calamine_sheet_cache[cache_key] = (mtime, rows)
+    else:
+        rows = cached[1]
+
+    for row in rows:
+        yield tuple(row) if max_col is None else tuple(row[:max_col])
+
+
+def _iter_raw_rows_xlrd(file_path: Path, sheet_name: str,
+                        max_col: Optional[int] = None) -> Iterator[tuple]:
+    """Отдаёт все строки листа устаревшего формата .xls через xlrd."""
+    book = xlrd.open_workbook(str(file_path), on_demand=True)
+    try:
+        sheet = book.sheet_by_name(sheet_name)
+        for row_idx in range(sheet.nrows):
+            yield tuple(sheet.row_values(row_idx, end_colx=max_col))
+    finally:
+        book.release_resources()
+
+
+def iter_raw_excel_rows(file_path: Path, sheet_name: str,
+                        max_col: Optional[int] = None) -> Iterator[tuple]:
     """
-    Читает данные из Excel-файла и определяет маппинг столбцов.
-    
+    Выбирает самый быстрый доступный движок чтения по расширению файла.
+
+    .xls читается через xlrd (openpyxl этот формат не открывает вовсе);
+    .xlsx — через python-calamine, если он установлен, иначе потоково
+    через openpyxl.
+
+    Args:
+        file_path: Путь к Excel-файлу
+        sheet_name: Имя листа для чтения
+        max_col: Читать только первые max_col столбцов (None — все)
+
+    Returns:
+        Iterator[tuple]: Итератор всех строк листа с исходными значениями ячеек
+    """
+    if file_path.suffix.lower() == '.xls':
+        if xlrd is None:
+            raise InvalidFileException(
+                "Файлы .xls не поддерживаются openpyxl. "
+                "Установите библиотеку xlrd: pip install xlrd"
+            )
+        return _iter_raw_rows_xlrd(file_path, sheet_name, max_col)
+
+    if CalamineWorkbook is not None:
+        return _iter_raw_rows_calamine(file_path, sheet_name, max_col)
+
+    return _iter_raw_rows_openpyxl(file_path, sheet_name, max_col)
+
+
+def get_sheet_names(file_path: Path) -> List[str]:
+    """
+    Возвращает список имён листов файла, не читая сами данные.
+
+    Args:
+        file_path: Путь к Excel-файлу
+
+    Returns:
+        List[str]: Имена листов в порядке следования в файле
+    """
+    if file_path.suffix.lower() == '.xls':
+        if xlrd is None:
+            raise InvalidFileException(
+                "Файлы .xls не поддерживаются openpyxl. "
+                "Установите библиотеку xlrd: pip install xlrd"
+            )
+        book = xlrd.open_workbook(str(file_path), on_demand=True)
+        try:
+            return book.sheet_names()
+        finally:
+            book.release_resources()
+
+    if CalamineWorkbook is not None:
+        return CalamineWorkbook.from_path(str(file_path)).sheet_names
+
+    workbook = load_workbook(file_path, data_only=True, read_only=True)
+    try:
+        return workbook.sheetnames
+    finally:
+        workbook.close()
+
+
+def iter_excel_rows(file_path: Path, sheet_name: str,
+                    max_col: Optional[int] = None) -> Iterator[tuple]:
+    """
+    Читает строки данных листа (без строки заголовков).
+
+    Для движков openpyxl и xlrd строки отдаются потоково и весь лист не
+    находится в памяти целиком; путь через python-calamine (по умолчанию
+    самый быстрый, если движок установлен) материализует лист и держит
+    его в кэше — размен памяти на скорость парсинга, см. комментарий у
+    _calamine_sheet_cache. Значения ячеек отдаются как есть: приведение
+    к строкам (stringify_row) выполняется только для строк, которые
+    реально попадают в превью или в документ.
+
+    Args:
+        file_path: Путь к Excel-файлу
+        sheet_name: Имя листа для чтения
+        max_col: Читать только первые max_col столбцов (None — все)
+
+    Returns:
+        Iterator[tuple]: Итератор строк данных с исходными значениями ячеек
+    """
+    rows_iter = iter_raw_excel_rows(file_path, sheet_name, max_col)
+    next(rows_iter, None)  # Пропускаем строку заголовков
+    return rows_iter
+
+
+def stringify_row(row: tuple) -> Row:
+    """
+    Приводит значения ячеек строки к строкам, заменяя None на "".
+
+    Args:
+        row: Строка с исходными значениями ячеек
+
+    Returns:
+        Row: Та же строка со значениями-строками
+    """
+    # map(str, ...) гоняет конвертацию в C-цикле без условного перехода
+    # на каждую ячейку; генератор лишь подменяет None пустой строкой
+    return tuple(map(str, ("" if c is None else c for c in row)))
+
+
+def read_excel_file(file_path: Path, sheet_name: Optional[str] = None) -> Tuple[Optional[Callable[..., Iterator[tuple]]], Optional[str], dict, Optional[int]]:
+    """
+    Определяет лист и маппинг столбцов Excel-файла, не загружая данные.
+
+    Читается только строка заголовков; сами данные отдаются лениво через
+    возвращаемую фабрику итератора (iter_excel_rows), чтобы большие файлы
+    не материализовались в память до того, как пользователь сделал выбор.
+
     Args:
         file_path: Путь к Excel-файлу
         sheet_name: Имя листа для чтения (если None, используется первый лист)
-        
+
     Returns:
-        Tuple[List[List[str]], Optional[str], dict, Optional[int]]: 
-        (Данные, имя листа, маппинг столбцов, индекс столбца конструкций)
+        Tuple[Optional[Callable], Optional[str], dict, Optional[int]]:
+        (Фабрика итератора строк, имя листа, маппинг столбцов, индекс столбца конструкций)
         Маппинг: {word_column_index: excel_column_index} или {word_column_index: None}
     """
     try:
-        workbook = load_workbook(file_path, data_only=True)
-        
+        # Читаем только список листов — движок выбирается по расширению
+        # файла (.xls → xlrd, .xlsx → calamine/openpyxl)
+        sheet_names = get_sheet_names(file_path)
+
         # Если лист не указан, используем первый
         if sheet_name is None:
-            sheet_name = workbook.sheetnames[0]
-        
-        sheet = workbook[sheet_name]
-        
+            sheet_name = sheet_names[0]
+
         # Если есть несколько листов, предлагаем выбрать
-        if len(workbook.sheetnames) > 1:
-            print(f"\nВ файле найдено {len(workbook.sheetnames)} лист(ов):")
-            for idx, name in enumerate(workbook.sheetnames, start=1):
+        if len(sheet_names) > 1:
+            print(f"\nВ файле найдено {len(sheet_names)} лист(ов):")
+            for idx, name in enumerate(sheet_names, start=1):
                 marker = " ← выбран" if name == sheet_name else ""
                 print(f"  {idx}. {name}{marker}")
-            
+
             choice = input(f"Использовать лист '{sheet_name}'? (Enter = да, или введите номер другого листа): ").strip()
             if choice:
                 try:
                     sheet_idx = int(choice) - 1
-                    if 0 <= sheet_idx < len(workbook.sheetnames):
-                        sheet_name = workbook.sheetnames[sheet_idx]
-                        sheet = workbook[sheet_name]
+                    if 0 <= sheet_idx < len(sheet_names):
+                        sheet_name = sheet_names[sheet_idx]
                     else:
                         print(f"⚠ Неверный номер. Используется лист '{sheet_name}'")
                 except ValueError:
                     print(f"⚠ Используется лист '{sheet_name}'")
-        
-        # Читаем первую строку как заголовки
-        first_row = next(sheet.iter_rows(values_only=True))
+
+        # Читаем только первую строку — заголовки; данные будут прочитаны
+        # лениво через iter_excel_rows, когда пользователь сделает выбор
+        first_row = next(iter_raw_excel_rows(file_path, sheet_name), ())
         headers = [str(cell).strip() if cell is not None else "" for cell in first_row]
         
         print(f"\n📋 Найденные заголовки столбцов в Excel:")
         for idx, header in enumerate(headers):
             if header:
                 print(f"   Столбец {idx + 1}: {header}")
+
+        # Нормализуем заголовки один раз и строим структуры для быстрого поиска
+        normalized_headers = [normalize_header(h) for h in headers]
+        header_map = build_header_map(normalized_headers)
+        compact_headers = build_compact_headers(header_map)
         
-        # Определяем маппинг столбцов Excel к столбцам Word-таблицы
+        # Определяем маппинг столбцов Excel к столбцам Word-таблицы по таблице
+        # алиасов COLUMN_SEARCH
         # Индексы Word-таблицы: 0=№ п/п, 1=Наименование, 2=Место, 3=Фото, 4=Параметр, 5=Примечание
         # В маппинге: ключ - это внутренний индекс (1-5), значение - индекс столбца в Excel
-        column_mapping = {}
-        
-        # Столбец 1: Наименование дефекта/повреждения (индекс 1 в Word-таблице)
-        excel_col = find_column_index(headers, [
-            "Наименование дефекта / повреждения",
-            "Наименование дефекта/повреждения",
-            "Наименование дефекта",
-            "Дефект",
-            "Повреждение"
-        ])
-        column_mapping[1] = excel_col
+        column_mapping = {
+            word_col: find_column_index(header_map, compact_headers, aliases)
+            for word_col, aliases in COLUMN_SEARCH.items()
+        }
+
+        # Столбец 2: Место расположения - оставляем пустым (не заполняем из Excel)
+        column_mapping[2] = None
+
+        excel_col = column_mapping[1]
         if excel_col is not None:
             print(f"✓ Найден столбец 'Наименование дефекта/повреждения': столбец {excel_col + 1} ({headers[excel_col]})")
         else:
             print(f"⚠ Столбец 'Наименование дефекта/повреждения' не найден, будет использован первый столбец")
-        
-        # Столбец 2: Место расположения - оставляем пустым (не заполняем из Excel)
-        column_mapping[2] = None
-        
+
         # Находим столбец с наименованием конструкций (для группировки)
-        construction_col = find_column_index(headers, [
-            "Наименование конструкций",
-            "Конструкции",
-            "Конструкция",
-            "Тип конструкции",
-            "Элемент конструкции"
-        ])
+        construction_col = find_column_index(header_map, compact_headers, CONSTRUCTION_ALIASES)
         if construction_col is not None:
             print(f"✓ Найден столбец 'Наименование конструкций': столбец {construction_col + 1} ({headers[construction_col]})")
         
-        # Столбец 3: Номер фото из фотоматериалов
-        excel_col = find_column_index(headers, [
-            "Номер фото из фотоматериалов",
-            "Номер фото",
-            "Фото",
-            "Фотоматериалы",
-            "Номер фото из фото"
-        ])
-        column_mapping[3] = excel_col
-        
-        # Столбец 4: Контролируемый параметр дефекта
-        excel_col = find_column_index(headers, [
-            "Контролируемый параметр дефекта",
-            "Параметр дефекта",
-            "Контролируемый параметр",
-            "Параметр",
-            "Параметры"
-        ])
-        column_mapping[4] = excel_col
-        
-        # Столбец 5: Примечание
-        excel_col = find_column_index(headers, [
-            "Примечание",
-            "Примечания",
-            "Комментарий",
-            "Замечания"
-        ])
-        column_mapping[5] = excel_col
-        
-        # Читаем все данные из листа (начиная со второй строки, так как первая - заголовки)
-        data = []
-        for row_idx, row in enumerate(sheet.iter_rows(values_only=True), start=1):
-            if row_idx == 1:
-                continue  # Пропускаем заголовки
-            # Преобразуем значения в строки, заменяя None на пустую строку
-            row_data = [str(cell) if cell is not None else "" for cell in row]
-            data.append(row_data)
-        
-        workbook.close()
-        print(f"✓ Загружено {len(data)} строк данных из листа '{sheet_name}'")
-        return data, sheet_name, column_mapping, construction_col
-        
-    except Exception as e:
+        # Фабрика итератора: каждый вызов открывает файл заново и отдаёт
+        # строки данных потоково (лист выбран — фиксируем его в замыкании)
+        chosen_sheet = sheet_name
+
+        def row_iter_factory(max_col: Optional[int] = None) -> Iterator[tuple]:
+            return iter_excel_rows(file_path, chosen_sheet, max_col)
+
+        return row_iter_factory, sheet_name, column_mapping, construction_col
+
+    except _EXCEL_READ_ERRORS as e:
         print(f"❌ Ошибка при чтении Excel-файла: {e}")
-        import traceback
         traceback.print_exc()
-        return [], None, {}, None
+        return None, None, {}, None
 
 
-def display_rows_preview(data: List[List[str]], max_rows: int = 20) -> None:
+def collect_preview_rows(rows_iter: Iterable[tuple], row_indices: Sequence[int],
+                         max_rows: int = 20) -> List[tuple]:
+    """
+    Собирает первые max_rows строк с указанными индексами для превью.
+
+    Чтение прекращается, как только набраны все нужные строки, поэтому
+    для превью большого файла не нужно проходить его целиком.
+
+    Args:
+        rows_iter: Потоковый источник строк данных (индексация с 0)
+        row_indices: Индексы интересующих строк (по возрастанию)
+        max_rows: Сколько строк нужно для превью
+
+    Returns:
+        List[Row]: Строки превью в порядке row_indices
+    """
+    wanted = set(row_indices[:max_rows])
+    if not wanted:
+        return []
+
+    last_needed = max(wanted)
+    preview_rows = []
+    for row_idx, row in enumerate(rows_iter):
+        if row_idx in wanted:
+            preview_rows.append(row)
+        if row_idx >= last_needed:
+            break
+
+    return preview_rows
+
+
+def display_rows_preview(preview_rows: List[tuple], total_rows: int, max_rows: int = 20) -> None:
     """
     Отображает превью строк для пользователя.
-    
+
     Args:
-        data: Данные из Excel
+        preview_rows: Первые строки данных для показа (не более max_rows)
+        total_rows: Общее количество доступных строк
         max_rows: Максимальное количество строк для отображения
     """
-    if not data:
+    if not preview_rows:
         print("⚠ Нет данных для отображения")
         return
-    
+
     print("\n" + "="*60)
     print("ПРЕВЬЮ ДАННЫХ (первые столбцы):")
     print("="*60)
-    
-    # Показываем первые столбцы каждой строки
-    for idx, row in enumerate(data[:max_rows], start=1):
-        preview = " | ".join(str(cell)[:30] for cell in row[:2])  # Первые 2 столбца
+
+    # Показываем первые два столбца каждой строки; islice и прямые индексы
+    # вместо срезов — без промежуточных списков на каждую строку
+    for idx, row in enumerate(islice(preview_rows, max_rows), start=1):
+        first = "" if not row or row[0] is None else str(row[0])[:30]
+        if len(row) > 1:
+            second = "" if row[1] is None else str(row[1])[:30]
+            preview = f"{first} | {second}"
+        else:
+            preview = first
         print(f"{idx:3d}. {preview}")
-    
-    if len(data) > max_rows:
-        print(f"... и ещё {len(data) - max_rows} строк(и)")
-    
+
+    if total_rows > max_rows:
+        print(f"... и ещё {total_rows - max_rows} строк(и)")
+
     print("="*60)
 
 
-def parse_row_selection(selection: str, total_rows: int) -> List[int]:
+# Токен выбора строк: одиночный номер ("12") или диапазон ("3-7")
+_SELECTION_RE = re.compile(r'\s*(\d+)\s*(?:-\s*(\d+))?\s*$')
+
+
+def parse_row_selection(selection: str, total_rows: int) -> Tuple[int, ...]:
     """
-    Парсит строку выбора пользователя и возвращает список индексов строк.
-    
+    Парсит строку выбора пользователя и возвращает индексы строк.
+
     Поддерживаемые форматы:
     - "1" - одна строка
     - "2-5" - диапазон
     - "1,3,7" - несколько через запятую
     - "all" - все строки
-    
+
     Args:
         selection: Строка выбора пользователя
         total_rows: Общее количество доступных строк
-        
+
     Returns:
-        List[int]: Список индексов строк (0-based)
+        Tuple[int, ...]: Индексы строк (0-based)
     """
     selection = selection.strip().lower()
-    
+
     if selection == "all":
-        return list(range(total_rows))
-    
-    selected_indices = []
-    
-    # Разделяем по запятой
-    parts = selection.split(',')
-    
-    for part in parts:
-        part = part.strip()
-        
-        if '-' in part:
-            # Диапазон (например, "2-5")
-            try:
-                start, end = part.split('-', 1)
-                start_idx = int(start.strip()) - 1  # Преобразуем в 0-based
-                end_idx = int(end.strip())  # Пользователь вводит 1-based
-                
-                if start_idx < 0:
-                    start_idx = 0
-                if end_idx > total_rows:
-                    end_idx = total_rows
-                
-                selected_indices.extend(range(start_idx, end_idx))
-            except ValueError:
-                print(f"⚠ Некорректный диапазон: {part}")
-        else:
+        return tuple(range(total_rows))
+
+    # Сразу копим во множестве: дубликаты отсеиваются на лету,
+    # без промежуточного списка и дополнительного прохода в конце
+    selected_indices = set()
+
+    # Каждый токен разбирается одним совпадением регулярного выражения
+    # вместо цепочки split/int/except на каждую часть
+    for part in selection.split(','):
+        match = _SELECTION_RE.match(part)
+        if match is None:
+            print(f"⚠ Некорректный номер или диапазон: {part.strip()}")
+            continue
+
+        start, end = match.groups()
+        if end is None:
             # Одна строка
-            try:
-                row_idx = int(part) - 1  # Преобразуем в 0-based
-                if 0 <= row_idx < total_rows:
-                    selected_indices.append(row_idx)
-                else:
-                    print(f"⚠ Строка {part} вне диапазона (1-{total_rows})")
-            except ValueError:
-                print(f"⚠ Некорректный номер строки: {part}")
-    
-    # Удаляем дубликаты и сортируем
-    selected_indices = sorted(set(selected_indices))
-    return selected_indices
+            row_idx = int(start) - 1  # Преобразуем в 0-based
+            if 0 <= row_idx < total_rows:
+                selected_indices.add(row_idx)
+            else:
+                print(f"⚠ Строка {part.strip()} вне диапазона (1-{total_rows})")
+        else:
+            # Диапазон (например, "2-5"): начало 0-based, конец 1-based
+            start_idx = max(int(start) - 1, 0)
+            end_idx = min(int(end), total_rows)
+            selected_indices.update(range(start_idx, end_idx))
+
+    return tuple(sorted(selected_indices))
 
 
-def get_available_constructions(data_rows: List[List[str]], construction_col: Optional[int]) -> List[str]:
+def build_construction_per_row(data_rows: Iterable[tuple], construction_col: Optional[int]) -> List[str]:
     """
-    Получает список доступных конструкций из данных Excel.
-    
+    Вычисляет название конструкции для каждой строки данных один раз.
+
+    Принимает любой итерируемый источник строк (в том числе потоковый
+    итератор из iter_excel_rows) и удерживает в памяти только сами
+    названия. К строке приводится единственная нужная ячейка — остальные
+    значения строки не конвертируются.
+
     Args:
-        data_rows: Все строки данных из Excel
+        data_rows: Строки данных из Excel (список или потоковый итератор)
         construction_col: Индекс столбца с наименованием конструкций или None
-        
+
     Returns:
-        List[str]: Список уникальных конструкций (отсортированный)
+        List[str]: Название конструкции для каждой строки ("" — если нет)
     """
     if construction_col is None:
-        return []
-    
-    constructions = set()
+        return ["" for _ in data_rows]
+
+    # Одни и те же названия повторяются сотнями строк — интернирование
+    # сводит их к одному объекту на имя, а сравнения к проверке указателя
+    _intern = sys.intern
+    names: List[str] = []
     for row in data_rows:
-        if construction_col < len(row):
-            construction_name = str(row[construction_col]).strip()
-            if construction_name:
-                constructions.add(construction_name)
-    
-    return sorted(list(constructions))
+        cell = row[construction_col] if construction_col < len(row) else None
+        names.append("" if cell is None else _intern(str(cell).strip()))
+    return names
 
 
-def select_constructions(data_rows: List[List[str]], construction_col: Optional[int]) -> Optional[List[str]]:
+def get_available_constructions(construction_per_row: List[str]) -> List[str]:
+    """
+    Получает список доступных конструкций из данных Excel.
+
+    Args:
+        construction_per_row: Названия конструкций по строкам (из build_construction_per_row)
+
+    Returns:
+        List[str]: Список уникальных конструкций (отсортированный)
+    """
+    return sorted({name for name in construction_per_row if name})
+
+
+def select_constructions(construction_per_row: List[str], construction_col: Optional[int]) -> Optional[List[str]]:
     """
     Позволяет пользователю выбрать конструкции, где описываются дефекты.
-    
+
     Args:
-        data_rows: Все строки данных из Excel
+        construction_per_row: Названия конструкций по строкам (из build_construction_per_row)
         construction_col: Индекс столбца с наименованием конструкций или None
-        
+
     Returns:
         Optional[List[str]]: Список выбранных конструкций или None (если столбец не найден)
     """
@@ -458,7 +777,7 @@ def select_constructions(data_rows: List[List[str]], construction_col: Optional[
         print("="*60)
         return None
     
-    constructions = get_available_constructions(data_rows, construction_col)
+    constructions = get_available_constructions(construction_per_row)
     
     if not constructions:
         print("\n" + "="*60)
@@ -501,40 +820,11 @@ def select_constructions(data_rows: List[List[str]], construction_col: Optional[
                     print(f"   • {constr}")
                 return selected_constructions
             
-            selected_indices = []
-            parts = selection.split(',')
-            
-            for part in parts:
-                part = part.strip()
-                
-                # Обработка диапазонов (например, "1-3")
-                if '-' in part:
-                    try:
-                        start, end = part.split('-', 1)
-                        start_idx = int(start.strip()) - 1
-                        end_idx = int(end.strip())
-                        
-                        if start_idx < 0:
-                            start_idx = 0
-                        if end_idx > len(constructions):
-                            end_idx = len(constructions)
-                        
-                        selected_indices.extend(range(start_idx, end_idx))
-                    except ValueError:
-                        print(f"⚠ Некорректный диапазон: {part}")
-                else:
-                    # Одна конструкция
-                    try:
-                        idx = int(part) - 1
-                        if 0 <= idx < len(constructions):
-                            selected_indices.append(idx)
-                        else:
-                            print(f"⚠ Номер {part} вне диапазона (1-{len(constructions)})")
-                    except ValueError:
-                        print(f"⚠ Некорректный номер: {part}")
-            
+            # Разбор "номер / диапазон / перечисление" общий с выбором строк
+            selected_indices = parse_row_selection(selection, len(constructions))
+
             if selected_indices:
-                selected_constructions = [constructions[i] for i in sorted(set(selected_indices))]
+                selected_constructions = [constructions[i] for i in selected_indices]
                 print(f"\n✓ Выбрано {len(selected_constructions)} конструкций для обработки:")
                 for constr in selected_constructions:
                     print(f"   • {constr}")
@@ -549,50 +839,48 @@ def select_constructions(data_rows: List[List[str]], construction_col: Optional[
             return None
 
 
-def filter_rows_by_constructions(data_rows: List[List[str]], row_indices: List[int], 
-                                 construction_col: Optional[int], 
-                                 selected_constructions: Optional[List[str]]) -> List[int]:
+def filter_rows_by_constructions(construction_per_row: List[str],
+                                 selected_constructions: Optional[List[str]]) -> Sequence[int]:
     """
-    Фильтрует строки по выбранным конструкциям.
-    
+    Строит отображение «номер отфильтрованной строки → исходный индекс».
+
     Args:
-        data_rows: Все строки данных из Excel
-        row_indices: Исходные индексы строк
-        construction_col: Индекс столбца с наименованием конструкций или None
-        selected_constructions: Список выбранных конструкций или None
-        
+        construction_per_row: Названия конструкций по строкам (из build_construction_per_row)
+        selected_constructions: Список выбранных конструкций или None (без фильтра)
+
     Returns:
-        List[int]: Отфильтрованные индексы строк
+        Sequence[int]: Исходные индексы строк, прошедших фильтр; без
+        фильтра отображение тождественное — range служит «представлением»
+        без материализации списка на все строки листа
     """
-    if selected_constructions is None or construction_col is None:
-        return row_indices
-    
-    filtered_indices = []
-    for row_idx in row_indices:
-        if row_idx < len(data_rows):
-            row = data_rows[row_idx]
-            if construction_col < len(row):
-                construction_name = str(row[construction_col]).strip()
-                if construction_name in selected_constructions:
-                    filtered_indices.append(row_idx)
-    
-    return filtered_indices
+    if selected_constructions is None:
+        return range(len(construction_per_row))
+
+    # Множество вместо списка: проверка принадлежности за O(1).
+    # array('i') хранит индексы компактным C-массивом, а не списком
+    # объектов int — для сотен тысяч строк это в разы меньше памяти
+    selected_set = frozenset(selected_constructions)
+    return array('i', (
+        row_idx for row_idx, name in enumerate(construction_per_row)
+        if name in selected_set
+    ))
 
 
-def select_rows(data: List[List[str]]) -> List[int]:
+def select_rows(preview_rows: List[Row], total_rows: int) -> List[int]:
     """
     Позволяет пользователю выбрать строки для обработки.
-    
+
     Args:
-        data: Данные из Excel
-        
+        preview_rows: Первые строки данных для превью
+        total_rows: Общее количество доступных строк
+
     Returns:
         List[int]: Список индексов выбранных строк (0-based)
     """
-    if not data:
+    if total_rows <= 0:
         return []
-    
-    display_rows_preview(data)
+
+    display_rows_preview(preview_rows, total_rows)
     
     print("\n" + "="*60)
     print("ВЫБОР СТРОК ДЛЯ ОБРАБОТКИ:")
@@ -606,13 +894,13 @@ def select_rows(data: List[List[str]]) -> List[int]:
     
     while True:
         try:
-            selection = input(f"\nВведите номера строк (1-{len(data)}): ").strip()
+            selection = input(f"\nВведите номера строк (1-{total_rows}): ").strip()
             
             if not selection:
                 print("❌ Введите выбор строк")
                 continue
             
-            selected_indices = parse_row_selection(selection, len(data))
+            selected_indices = list(parse_row_selection(selection, total_rows))
             
             if selected_indices:
                 print(f"\n✓ Выбрано {len(selected_indices)} строк(и): {selected_indices[0]+1}-{selected_indices[-1]+1}")
@@ -642,7 +930,7 @@ def get_font_name() -> str:
 # ФУНКЦИИ ГЕНЕРАЦИИ WORD-ДОКУМЕНТОВ
 # ============================================================================
 
-def group_rows_by_construction(data_rows: List[List[str]], row_indices: List[int], 
+def group_rows_by_construction(data_rows: List[Row], row_indices: List[int], 
                                 construction_col: Optional[int]) -> List[Tuple[Optional[str], List[int]]]:
     """
     Группирует строки по конструкциям.
@@ -658,33 +946,43 @@ def group_rows_by_construction(data_rows: List[List[str]], row_indices: List[int
     if construction_col is None:
         # Если нет столбца конструкций, все строки в одну группу
         return [(None, row_indices)]
-    
-    # Группируем по конструкциям
-    groups = {}
+
+    # Имя каждой строки вычисляется ровно один раз
+    n_rows = len(data_rows)
+    names: List[Optional[str]] = []
     for row_idx in row_indices:
-        if row_idx < len(data_rows):
+        if row_idx < n_rows:
             row = data_rows[row_idx]
-            if construction_col < len(row):
-                construction_name = str(row[construction_col]).strip()
-                if not construction_name:
-                    construction_name = None
-            else:
-                construction_name = None
+            construction_name = (str(row[construction_col]).strip() or None
+                                 if construction_col < len(row) else None)
         else:
             construction_name = None
-        
-        if construction_name not in groups:
-            groups[construction_name] = []
-        groups[construction_name].append(row_idx)
-    
-    # Возвращаем в виде списка кортежей
-    result = [(name, sorted(indices)) for name, indices in groups.items()]
-    # Сортируем так, чтобы None был в конце
-    result.sort(key=lambda x: (x[0] is None, x[0] or ""))
-    return result
+        names.append(construction_name)
 
+    # Быстрый путь: все выбранные строки относятся к одной конструкции —
+    # обычный случай после фильтрации по конструкции в main. Ни
+    # декорирования, ни сортировки групп тогда не нужно
+    if names and all(name == names[0] for name in names):
+        return [(names[0], sorted(row_indices))]
 
-def create_word_document(data_rows: List[List[str]], row_indices: List[int], 
+    # Одна сортировка + groupby вместо словаря списков: декорированные
+    # кортежи (имя_пустое, имя, индекс) сравниваются на уровне C без
+    # Python-ключа, сортировка сразу даёт итоговый порядок групп
+    # (по алфавиту, безымянные в конце) и упорядоченные индексы внутри них
+    decorated = [
+        (name is None, name or "", row_idx)
+        for name, row_idx in zip(names, row_indices)
+    ]
+    decorated.sort()
+
+    # itemgetter реализован на C и вызывается быстрее Python-лямбды
+    return [
+        (None if is_none else name, [item[2] for item in group])
+        for (is_none, name), group in groupby(decorated, key=itemgetter(0, 1))
+    ]
+
+
+def create_word_document(data_rows: List[Row], row_indices: List[int], 
                         output_filename: str, source_file: str, column_mapping: dict,
                         construction_col: Optional[int]) -> Optional[Path]:
     """
@@ -704,6 +1002,10 @@ def create_word_document(data_rows: List[List[str]], row_indices: List[int],
     try:
         # Создаём новый документ
         doc = Document()
+
+        # Имя шрифта определяется один раз на документ, а не на каждый
+        # фрагмент форматирования
+        font_name = get_font_name()
         
         # Настройка страницы: A4, альбомная ориентация
         section = doc.sections[0]
@@ -726,7 +1028,7 @@ def create_word_document(data_rows: List[List[str]], row_indices: List[int],
         title = doc.add_paragraph("Список дефектов и повреждений")
         title.alignment = WD_ALIGN_PARAGRAPH.CENTER
         title_format = title.runs[0].font
-        title_format.name = get_font_name()
+        title_format.name = font_name
         title_format.size = Pt(14)
         title_format.bold = True
         
@@ -734,7 +1036,7 @@ def create_word_document(data_rows: List[List[str]], row_indices: List[int],
         info = doc.add_paragraph(f"Источник: {source_file} | Строк: {len(row_indices)}")
         info.alignment = WD_ALIGN_PARAGRAPH.CENTER
         info_format = info.runs[0].font
-        info_format.name = get_font_name()
+        info_format.name = font_name
         info_format.size = Pt(9)
         info_format.italic = True
         
@@ -743,190 +1045,145 @@ def create_word_document(data_rows: List[List[str]], row_indices: List[int],
         
         # Группируем строки по конструкциям
         construction_groups = group_rows_by_construction(data_rows, row_indices, construction_col)
-        
-        # Подсчитываем общее количество строк: 2 заголовка + строки данных + строки-заголовки конструкций
-        num_data_rows = len(row_indices)
-        num_construction_headers = len([g for g in construction_groups if g[0] is not None])
+
         num_cols = len(TABLE_HEADERS)
-        num_rows_table = 2 + num_data_rows + num_construction_headers  # 2 заголовка + данные + заголовки конструкций
-        
-        table = doc.add_table(rows=num_rows_table, cols=num_cols)
-        table.style = 'Table Grid'  # Базовый стиль с границами
-        
-        # Настройка ширины столбцов - первый столбец минимальной ширины по содержимому
-        # № п/п - минимальная ширина (0.25"), остальные распределяются пропорционально
-        column_widths = [0.25, 2.5, 1.5, 1.0, 2.5, 1.5]  # № п/п (мин), Наименование, Место, Фото, Параметр, Примечание
-        total_width = sum(column_widths)
-        
-        for idx, col in enumerate(table.columns):
-            if idx == 0:
-                # Первый столбец "№ п/п" - минимальная ширина по содержимому
-                # Устанавливаем минимальную ширину, которая будет автоматически подстраиваться
-                col.width = Inches(0.25)
-            else:
-                # Остальные столбцы распределяются пропорционально
-                col.width = Inches(column_widths[idx] / (total_width - column_widths[0]) * (9.27 - 0.25))
-        
-        # Заполняем первую строку заголовков таблицы (наименования столбцов)
-        header_row1 = table.rows[0]
-        for col_idx, header_text in enumerate(TABLE_HEADERS):
-            cell = header_row1.cells[col_idx]
-            cell.text = header_text
-            
-            # Форматирование заголовка
-            cell.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
-            for paragraph in cell.paragraphs:
-                for run in paragraph.runs:
-                    run.font.name = get_font_name()
-                    run.font.size = FONT_SIZE
-                    run.font.bold = True
-            
-            # Настройка ячейки (выравнивание по центру по вертикали)
-            cell.vertical_alignment = WD_CELL_VERTICAL_ALIGNMENT.CENTER
-        
-        # Заполняем вторую строку заголовков (нумерация столбцов)
-        header_row2 = table.rows[1]
-        for col_idx, column_number in enumerate(COLUMN_NUMBERS):
-            cell = header_row2.cells[col_idx]
-            cell.text = column_number
-            
-            # Форматирование номера столбца
-            cell.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
-            for paragraph in cell.paragraphs:
-                for run in paragraph.runs:
-                    run.font.name = get_font_name()
-                    run.font.size = FONT_SIZE
-                    run.font.bold = True
-            
-            # Настройка ячейки (выравнивание по центру по вертикали)
-            cell.vertical_alignment = WD_CELL_VERTICAL_ALIGNMENT.CENTER
-        
+
+        # Таблица собирается целиком одной XML-строкой и парсится один раз.
+        # Это обходит обёртки Table/_Cell/Paragraph python-docx, которые на
+        # каждое обращение к ячейке заново обходят lxml-дерево: вместо
+        # O(строки·столбцы) мутаций дерева — одна сборка строки и один парс
+        _esc = escape
+
+        def make_rpr(size: int, bold: bool = False) -> str:
+            """Собирает общий фрагмент свойств шрифта <w:rPr>."""
+            bold_xml = '<w:b/>' if bold else ''
+            return (
+                f'<w:rPr><w:rFonts w:ascii="{font_name}" w:hAnsi="{font_name}"'
+                f' w:eastAsia="{font_name}"/>{bold_xml}'
+                f'<w:sz w:val="{size}"/><w:szCs w:val="{size}"/></w:rPr>'
+            )
+
+        rpr_data = make_rpr(FONT_SIZE_HALF_PT)
+        rpr_header = make_rpr(FONT_SIZE_HALF_PT, bold=True)
+        rpr_construction = make_rpr(CONSTRUCTION_FONT_SIZE_HALF_PT, bold=True)
+        ppr_center = '<w:pPr><w:jc w:val="center"/></w:pPr>'
+
+        widths_dxa = TABLE_COLUMN_WIDTHS_DXA
+        table_width_dxa = TABLE_WIDTH_DXA
+
+        def make_tc(width_dxa: int, text: str, rpr: str, grid_span: int = 0) -> str:
+            """Собирает ячейку <w:tc>; text должен быть уже XML-экранирован."""
+            span_xml = f'<w:gridSpan w:val="{grid_span}"/>' if grid_span else ''
+            # Перевод строки (Alt+Enter в Excel) и табуляция воспроизводятся
+            # как <w:br/> и <w:tab/>, как это делает текстовый сеттер
+            # python-docx: сырой \n внутри <w:t> Word переносом не считает
+            if '\n' in text or '\t' in text:
+                text = (
+                    text.replace('\n', '</w:t><w:br/><w:t xml:space="preserve">')
+                        .replace('\t', '</w:t><w:tab/><w:t xml:space="preserve">')
+                )
+            return (
+                f'<w:tc><w:tcPr><w:tcW w:w="{width_dxa}" w:type="dxa"/>{span_xml}'
+                f'<w:vAlign w:val="center"/></w:tcPr>'
+                f'<w:p>{ppr_center}<w:r>{rpr}'
+                f'<w:t xml:space="preserve">{text}</w:t></w:r></w:p></w:tc>'
+            )
+
+        rows_xml = []
+
+        # Две строки заголовков: наименования столбцов и их номера
+        rows_xml.append('<w:tr>' + ''.join(
+            make_tc(widths_dxa[i], _esc(TABLE_HEADERS[i]), rpr_header)
+            for i in range(num_cols)) + '</w:tr>')
+        rows_xml.append('<w:tr>' + ''.join(
+            make_tc(widths_dxa[i], COLUMN_NUMBERS[i], rpr_header)
+            for i in range(num_cols)) + '</w:tr>')
+
+        # Маппинг столбцов разрешается один раз перед циклом, а не четырьмя
+        # dict.get на каждую строку; -1 — «столбца нет»
+        mapped_cols = tuple(
+            excel_col if (excel_col := column_mapping.get(word_col)) is not None else -1
+            for word_col in (1, 2, 3, 4, 5)
+        )
+
+        # str() нужен только ячейкам, которые ещё не строки
+        _fast_str = lambda v: '' if v is None else v if type(v) is str else str(v)
+
         # Заполняем данные из выбранных строк с группировкой по конструкциям
-        current_table_row = 2  # Начинаем с 2, так как 0 и 1 - это заголовки
         row_counter = 1  # Счётчик для нумерации строк в столбце "№ п/п"
-        
         for construction_name, group_row_indices in construction_groups:
-            # Если есть название конструкции, вставляем строку-заголовок
+            # Строка-заголовок конструкции: одна ячейка на всю ширину
+            # таблицы через gridSpan — вместо цепочки merge() по столбцам
             if construction_name is not None:
-                header_row = table.rows[current_table_row]
-                
-                # Объединяем ячейки через всю таблицу для заголовка конструкции
-                # Объединяем с конца, чтобы избежать проблем с изменяющимся списком ячеек
-                first_cell = header_row.cells[0]
-                # Объединяем все остальные ячейки с первой
-                for col_idx in range(num_cols - 1, 0, -1):
-                    first_cell.merge(header_row.cells[col_idx])
-                
-                # Устанавливаем текст заголовка конструкции
-                first_cell.text = construction_name
-                
-                # Форматирование строки-заголовка конструкции
-                first_cell.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
-                for paragraph in first_cell.paragraphs:
-                    for run in paragraph.runs:
-                        run.font.name = get_font_name()
-                        run.font.size = Pt(12)  # Чуть крупнее для заголовка
-                        run.font.bold = True
-                first_cell.vertical_alignment = WD_CELL_VERTICAL_ALIGNMENT.CENTER
-                
-                current_table_row += 1
-            
-            # Заполняем строки данных для этой конструкции
-            for data_row_idx in group_row_indices:
-                row = table.rows[current_table_row]
-                data_row = data_rows[data_row_idx]
-                
-                # Столбец 0: № п/п - порядковая нумерация строк
-                row.cells[0].text = str(row_counter)
-                
-                # Столбец 1: Наименование дефекта/повреждения
-                excel_col_idx = column_mapping.get(1)
-                if excel_col_idx is not None and excel_col_idx < len(data_row):
-                    row.cells[1].text = str(data_row[excel_col_idx])
-                else:
-                    row.cells[1].text = ""
-                
-                # Столбец 2: Место расположения - всегда пустой
-                row.cells[2].text = ""
-                
-                # Столбец 3: Номер фото из фотоматериалов
-                excel_col_idx = column_mapping.get(3)
-                if excel_col_idx is not None and excel_col_idx < len(data_row):
-                    row.cells[3].text = str(data_row[excel_col_idx])
-                else:
-                    row.cells[3].text = ""
-                
-                # Столбец 4: Контролируемый параметр дефекта
-                excel_col_idx = column_mapping.get(4)
-                if excel_col_idx is not None and excel_col_idx < len(data_row):
-                    row.cells[4].text = str(data_row[excel_col_idx])
-                else:
-                    row.cells[4].text = ""
-                
-                # Столбец 5: Примечание
-                excel_col_idx = column_mapping.get(5)
-                if excel_col_idx is not None and excel_col_idx < len(data_row):
-                    row.cells[5].text = str(data_row[excel_col_idx])
-                else:
-                    row.cells[5].text = ""
-                
-                # Форматирование всех ячеек строки
-                for word_col_idx in range(num_cols):
-                    cell = row.cells[word_col_idx]
-                    cell.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
-                    for paragraph in cell.paragraphs:
-                        for run in paragraph.runs:
-                            run.font.name = get_font_name()
-                            run.font.size = FONT_SIZE
-                    cell.vertical_alignment = WD_CELL_VERTICAL_ALIGNMENT.CENTER
-                
-                row_counter += 1  # Увеличиваем счётчик порядковой нумерации
-                current_table_row += 1
-        
-        # Настройка границ таблицы
-        from docx.oxml.ns import qn
-        from docx.oxml import OxmlElement
-        
-        tbl = table._tbl
-        tblBorders = OxmlElement('w:tblBorders')
-        
-        borders = ['top', 'left', 'bottom', 'right', 'insideH', 'insideV']
-        for border_name in borders:
-            border = OxmlElement(f'w:{border_name}')
-            border.set(qn('w:val'), 'single')
-            border.set(qn('w:sz'), '4')  # 0.5pt = 4 единиц (1/8 pt)
-            border.set(qn('w:space'), '0')
-            border.set(qn('w:color'), '000000')  # Чёрный
-            tblBorders.append(border)
-        
-        tbl.tblPr.append(tblBorders)
+                rows_xml.append('<w:tr>' + make_tc(
+                    table_width_dxa, _esc(construction_name), rpr_construction,
+                    grid_span=num_cols) + '</w:tr>')
+
+            # Колоночная пакетная конвертация: значения и XML-эскейп
+            # считаются списковыми включениями по столбцам (отсутствующий
+            # столбец обрабатывается один раз на группу), затем строки
+            # собираются обратно через zip
+            group_rows = [data_rows[i] for i in group_row_indices]
+            col_vals = [
+                ["" for _ in group_rows] if c < 0 else
+                [_esc(_fast_str(row[c])) if c < len(row) else "" for row in group_rows]
+                for c in mapped_cols
+            ]
+
+            for row_vals in zip(*col_vals):
+                # Столбец 0: № п/п — порядковая нумерация строк;
+                # столбец 2 (Место расположения) остаётся пустым
+                cells = [make_tc(widths_dxa[0], str(row_counter), rpr_data)]
+                for word_col, value in zip((1, 2, 3, 4, 5), row_vals):
+                    cells.append(make_tc(widths_dxa[word_col], value, rpr_data))
+
+                rows_xml.append('<w:tr>' + ''.join(cells) + '</w:tr>')
+                row_counter += 1
+
+        grid_xml = ''.join(f'<w:gridCol w:w="{w}"/>' for w in widths_dxa)
+        tbl_xml = (
+            f'<w:tbl xmlns:w="{nsmap["w"]}">'
+            f'<w:tblPr><w:tblStyle w:val="TableGrid"/>'
+            f'<w:tblW w:w="{table_width_dxa}" w:type="dxa"/>'
+            f'<w:tblLayout w:type="fixed"/></w:tblPr>'
+            f'<w:tblGrid>{grid_xml}</w:tblGrid>'
+            f'{"".join(rows_xml)}</w:tbl>'
+        )
+        tbl = etree.fromstring(tbl_xml)
+
+        # Настройка границ таблицы: литерал разобран из готовой строки
+        tbl.find(qn('w:tblPr')).append(etree.fromstring(_TBL_BORDERS_XML))
+
+        # Вставляем готовую таблицу перед завершающим w:sectPr тела документа
+        body = doc.element.body
+        body.insert(len(body) - 1, tbl)
         
         # Сохраняем документ
         output_path = OUTPUT_DIR / output_filename
-        
-        # Проверяем, существует ли файл и можем ли мы его перезаписать
-        if output_path.exists():
+
+        # Пишем во временный файл и атомарно подменяем итоговый через
+        # os.replace: без предварительных exists()/unlink() и без окна,
+        # в котором старый файл уже удалён, а новый ещё не записан
+        tmp_path = output_path.with_name(output_path.name + '.tmp')
+        try:
+            doc.save(str(tmp_path))
             try:
-                # Пробуем удалить существующий файл, если он не открыт
-                output_path.unlink()
+                os.replace(tmp_path, output_path)
             except PermissionError:
-                # Файл открыт в другой программе, создаем файл с другим именем
+                # Файл открыт в другой программе — сохраняем под именем с меткой времени
                 print(f"⚠ Файл {output_filename} уже открыт в другой программе.")
                 print("   Создаю файл с другим именем...")
-                
-                # Генерируем уникальное имя файла с временной меткой
+
                 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
                 name_parts = output_filename.rsplit('.', 1)
                 if len(name_parts) == 2:
                     new_filename = f"{name_parts[0]}_{timestamp}.{name_parts[1]}"
                 else:
                     new_filename = f"{output_filename}_{timestamp}"
-                
+
                 output_path = OUTPUT_DIR / new_filename
-        
-        # Пытаемся сохранить документ
-        try:
-            doc.save(str(output_path))
+                os.replace(tmp_path, output_path)
+
             print(f"✓ Документ сохранён: {output_path}")
             return output_path
         except PermissionError as e:
@@ -941,10 +1198,14 @@ def create_word_document(data_rows: List[List[str]], row_indices: List[int],
             print(f"   • Закрыть все программы, использующие файл")
             print(f"   • Проверить права доступа к папке output")
             return None
+        finally:
+            # Неудачное сохранение (включая ошибки, уходящие во внешний
+            # обработчик) не должно оставлять .tmp-файл в папке output;
+            # после успешного replace файла уже нет — missing_ok=True
+            tmp_path.unlink(missing_ok=True)
         
     except Exception as e:
         print(f"❌ Ошибка при создании Word-документа: {e}")
-        import traceback
         traceback.print_exc()
         return None
 
@@ -997,53 +1258,51 @@ def main():
         print("\n❌ Файл не выбран. Завершение работы.")
         return
     
-    # Читаем данные из Excel (возвращает данные, имя листа, маппинг столбцов и индекс столбца конструкций)
-    data, sheet_name, column_mapping, construction_col = read_excel_file(selected_file)
-    if not data:
+    # Определяем лист и маппинг столбцов; данные будут читаться потоково
+    row_iter_factory, sheet_name, column_mapping, construction_col = read_excel_file(selected_file)
+    if row_iter_factory is None:
         print("\n❌ Не удалось загрузить данные из Excel-файла.")
         return
-    
+
+    # Проход 1: читаем только столбец конструкций (и количество строк) —
+    # ячейки правее него движок даже не разбирает
+    first_pass_cols = 1 if construction_col is None else construction_col + 1
+    construction_per_row = build_construction_per_row(
+        row_iter_factory(max_col=first_pass_cols), construction_col)
+    total_rows = len(construction_per_row)
+    print(f"✓ Найдено {total_rows} строк данных в листе '{sheet_name}'")
+    if total_rows == 0:
+        print("\n❌ Не удалось загрузить данные из Excel-файла.")
+        return
+
     # Сначала выбираем конструкции для обработки (если столбец конструкций найден)
-    selected_constructions = select_constructions(data, construction_col)
-    
-    # Предварительная фильтрация данных по выбранным конструкциям (если выбраны)
-    filtered_data = data
+    selected_constructions = select_constructions(construction_per_row, construction_col)
+
+    # Индексы строк, прошедших фильтр по выбранным конструкциям
     if selected_constructions is not None and construction_col is not None:
-        # Фильтруем данные по конструкциям перед выбором строк
-        filtered_data = []
-        for row in data:
-            if construction_col < len(row):
-                construction_name = str(row[construction_col]).strip()
-                if construction_name in selected_constructions:
-                    filtered_data.append(row)
+        filtered_to_original = filter_rows_by_constructions(
+            construction_per_row, selected_constructions)
         print(f"\n✓ Данные предварительно отфильтрованы по выбранным конструкциям.")
-        print(f"   Доступно {len(filtered_data)} строк с дефектами для выбранных конструкций.")
-        if not filtered_data:
+        print(f"   Доступно {len(filtered_to_original)} строк с дефектами для выбранных конструкций.")
+        if not filtered_to_original:
             print("\n❌ После фильтрации по конструкциям не осталось строк. Завершение работы.")
             return
     else:
-        filtered_data = data
-    
+        filtered_to_original = filter_rows_by_constructions(construction_per_row, None)
+
+    # Проход 2: читаем только первые отфильтрованные строки для превью;
+    # в превью показываются лишь два первых столбца
+    preview_rows = collect_preview_rows(row_iter_factory(max_col=2), filtered_to_original)
+
     # Выбираем строки для обработки из отфильтрованных данных
-    selected_row_indices = select_rows(filtered_data)
+    selected_row_indices = select_rows(preview_rows, len(filtered_to_original))
     if not selected_row_indices:
         print("\n❌ Не выбрано ни одной строки. Завершение работы.")
         return
-    
-    # Если использовали отфильтрованные данные, нужно пересчитать индексы
-    if selected_constructions is not None and construction_col is not None:
-        # Находим исходные индексы строк в оригинальных данных
-        original_indices = []
-        filtered_idx = 0
-        for orig_idx, row in enumerate(data):
-            if construction_col < len(row):
-                construction_name = str(row[construction_col]).strip()
-                if construction_name in selected_constructions:
-                    if filtered_idx in selected_row_indices:
-                        original_indices.append(orig_idx)
-                    filtered_idx += 1
-        selected_row_indices = original_indices
-    
+
+    # Пересчитываем индексы выбора в исходные индексы строк файла
+    selected_row_indices = [filtered_to_original[i] for i in selected_row_indices]
+
     # Генерируем имя файла
     if len(selected_row_indices) == 1:
         row_label = str(selected_row_indices[0] + 1)
@@ -1051,13 +1310,28 @@ def main():
         first_row = selected_row_indices[0] + 1
         last_row = selected_row_indices[-1] + 1
         row_label = f"{first_row}-{last_row}"
-    
+
     output_filename = f"Дефекты_выборка_{row_label}.docx"
-    
+
+    # Проход 3: материализуем только выбранные строки — память пропорциональна
+    # размеру выборки, а не размеру листа
+    needed = set(selected_row_indices)
+    last_needed = max(needed)
+    rows_by_index = {}
+    for row_idx, row in enumerate(row_iter_factory()):
+        if row_idx in needed:
+            rows_by_index[row_idx] = row
+        # Хвост листа после последней выбранной строки не читаем вовсе
+        if row_idx >= last_needed:
+            break
+    # К строкам приводятся только выбранные строки — для 1% выборки
+    # это экономит 99% вызовов str() и строковых аллокаций
+    doc_rows = [stringify_row(rows_by_index[i]) for i in selected_row_indices if i in rows_by_index]
+
     # Создаём Word-документ (передаём маппинг столбцов и индекс столбца конструкций)
     output_path = create_word_document(
-        data, 
-        selected_row_indices, 
+        doc_rows,
+        list(range(len(doc_rows))),
         output_filename,
         selected_file.name,
         column_mapping,
@@ -1082,7 +1356,6 @@ if __name__ == "__main__":
         sys.exit(0)
     except Exception as e:
         print(f"\n❌ Критическая ошибка: {e}")
-        import traceback
         traceback.print_exc()
         sys.exit(1)
 